@@ -0,0 +1 @@
+"""Benchmarks for the AI on FHIR backend. Run from backend/ as `python -m benchmarks.<name>`."""
@@ -0,0 +1,118 @@
+"""
+Exact vs approximate analytics benchmark.
+
+Loads a synthetic cohort, times /analytics/chart-data and /query-style
+counts on both paths, and checks how often the exact count falls inside the
+reported 95% interval. Counts the strata decide outright (zero-width
+intervals) must match exactly and are reported separately.
+
+    python -m benchmarks.approximate --patients 1000000
+"""
+
+import argparse
+import statistics
+import time
+
+import main
+from records import load_patients
+from synthetic import generate_patients
+
+# Planted on --rare patients so the sample (almost surely) misses it entirely
+RARE_CODE = "Z99"
+RARE_DISPLAY = "Rare benchmark condition"
+
+FILTERS = [
+    {},
+    {"gender_filter": "female"},
+    {"age_filter": ">60"},
+    {"age_filter": "30-50", "gender_filter": "male"},
+    {"diagnosis_filter": "E11"},
+    {"diagnosis_filter": "I10", "age_filter": "<45"},
+    {"diagnosis_filter": RARE_CODE},
+]
+
+
+def _timed(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def _pairs(exact, approx):
+    """
+    Yield (name, exact_count, approx_interval) for every count either path
+    reports. A count missing from the approximate result yields None, so
+    groups the sample never saw are checked too.
+    """
+    yield "total", exact["total_patients"], approx["confidence_interval"]
+    for key, label in (
+        ("age_distribution", "age_group"),
+        ("gender_distribution", "gender"),
+        ("condition_distribution", "condition"),
+    ):
+        exact_counts = {e[label]: e["count"] for e in exact[key]}
+        approx_ci = {e[label]: e["confidence_interval"] for e in approx[key]}
+        for name in exact_counts.keys() | approx_ci.keys():
+            yield name, exact_counts.get(name, 0), approx_ci.get(name)
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rare", type=int, default=30, help=f"Patients given {RARE_CODE}")
+    args = parser.parse_args(argv)
+
+    raw = generate_patients(args.patients, seed=args.seed)
+    for p in raw[:: max(1, len(raw) // max(args.rare, 1))][: args.rare]:
+        p["conditions"].append({"code": RARE_CODE, "display": RARE_DISPLAY})
+    main.PATIENTS = load_patients(raw)
+    start = time.perf_counter()
+    sample = main.get_approximate_sample()
+    build_ms = (time.perf_counter() - start) * 1000
+    print(
+        f"{args.patients} patients, sample {len(sample.patients)} "
+        f"(built in {build_ms:.0f} ms)\n"
+    )
+    print(f"{'filters':<40} {'exact ms':>10} {'approx ms':>10} {'speedup':>8}")
+
+    inside = total = exact_checked = 0
+    misses = []
+    for filters in FILTERS:
+        exact, exact_ms = _timed(lambda: main.chart_data(**filters), args.repeat)
+        approx, approx_ms = _timed(
+            lambda: main.chart_data(**filters, approximate=True), args.repeat
+        )
+        label = ", ".join(f"{k}={v}" for k, v in filters.items()) or "(none)"
+        print(
+            f"{label:<40} {exact_ms:>10.1f} {approx_ms:>10.1f} "
+            f"{exact_ms / max(approx_ms, 1e-9):>7.1f}x"
+        )
+        for name, exact_count, ci in _pairs(exact, approx):
+            if ci is not None and ci["low"] == ci["high"]:
+                exact_checked += 1
+                if ci["low"] != exact_count:
+                    misses.append((label, name, exact_count, ci))
+                continue
+            total += 1
+            if ci is not None and ci["low"] <= exact_count <= ci["high"]:
+                inside += 1
+            else:
+                misses.append((label, name, exact_count, ci))
+
+    coverage = inside / max(total, 1)
+    print(f"\n{inside}/{total} estimated counts inside the 95% interval ({coverage:.1%})")
+    print(f"{exact_checked} counts decided by the strata (checked for exact equality)")
+    for label, name, exact_count, ci in misses:
+        print(f"  miss: [{label}] {name}: exact {exact_count}, interval {ci}")
+    exact_ok = all(ci is not None and ci["low"] != ci["high"] for _, _, _, ci in misses)
+    return 0 if coverage >= 0.9 and exact_ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(run())
@@ -0,0 +1,232 @@
+"""
+Concurrent load test for main:app.
+
+Starts uvicorn against a synthetic cohort (or targets --url), drives a mix of
+/query, /patients/search, /analytics/chart-data and /suggestions traffic from
+a pool of client threads, and reports throughput and latency percentiles per
+endpoint.
+
+    python -m benchmarks.loadtest --patients 50000 --concurrency 32 --duration 30
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import requests
+
+from data import QUERY_SUGGESTIONS
+from querylog import percentile
+
+AGE_FILTERS = [None, "<30", "30-50", "50-70", "70+", ">60"]
+GENDERS = [None, "male", "female"]
+DIAGNOSES = [None, "E11", "E10", "I10", "J45", "I50"]
+
+# (method, path, requests kwargs)
+Request = Tuple[str, str, Dict]
+
+
+def _filters(rng: random.Random) -> Dict[str, str]:
+    params = {
+        "age_filter": rng.choice(AGE_FILTERS),
+        "gender_filter": rng.choice(GENDERS),
+        "diagnosis_filter": rng.choice(DIAGNOSES),
+    }
+    return {k: v for k, v in params.items() if v}
+
+
+def _query(rng: random.Random) -> Request:
+    return "POST", "/query", {"json": {"query": rng.choice(QUERY_SUGGESTIONS)}}
+
+
+def _search(rng: random.Random) -> Request:
+    params = _filters(rng)
+    params.update(page=rng.randint(1, 5), limit=rng.choice((10, 25, 50)))
+    return "GET", "/patients/search", {"params": params}
+
+
+def _chart(rng: random.Random) -> Request:
+    return "GET", "/analytics/chart-data", {"params": _filters(rng)}
+
+
+def _suggestions(rng: random.Random) -> Request:
+    word = rng.choice(rng.choice(QUERY_SUGGESTIONS).split())
+    return "GET", "/suggestions", {"params": {"q": word[: rng.randint(1, len(word))]}}
+
+
+# endpoint -> (traffic weight, request builder)
+ENDPOINTS: Dict[str, Tuple[int, Callable[[random.Random], Request]]] = {
+    "/query": (3, _query),
+    "/patients/search": (3, _search),
+    "/analytics/chart-data": (2, _chart),
+    "/suggestions": (2, _suggestions),
+}
+
+# Endpoints that also have an /async variant in main.py
+ASYNC_VARIANTS = {"/query", "/patients/search", "/analytics/chart-data"}
+
+
+def start_server(
+    port: int, patients: int, seed: int, show_logs: bool = False
+) -> subprocess.Popen:
+    """Launch uvicorn main:app on a synthetic cohort and wait for /health."""
+    env = dict(os.environ, SYNTHETIC_PATIENTS=str(patients), SYNTHETIC_SEED=str(seed))
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port), "--log-level", "warning",
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env,
+        stdout=None if show_logs else subprocess.DEVNULL,
+        stderr=None if show_logs else subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1).raise_for_status()
+            return proc
+        except requests.RequestException:
+            time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy within 120s")
+
+
+def run_load(
+    base_url: str,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+    use_async: bool = False,
+) -> Dict[str, Dict]:
+    """
+    Drive mixed traffic for `duration` seconds; return per-endpoint samples.
+    With `use_async`, requests go to the /async variants where one exists.
+    """
+    names = list(ENDPOINTS)
+    weights = [ENDPOINTS[n][0] for n in names]
+    latencies: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+    lock = threading.Lock()
+    measure_from = time.monotonic() + warmup
+    stop_at = measure_from + duration
+
+    def worker(worker_id: int):
+        rng = random.Random(seed + worker_id)
+        session = requests.Session()
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            name = rng.choices(names, weights)[0]
+            method, path, kwargs = ENDPOINTS[name][1](rng)
+            if use_async and path in ASYNC_VARIANTS:
+                path = "/async" + path
+            start = time.perf_counter()
+            try:
+                ok = session.request(method, base_url + path, timeout=60, **kwargs).ok
+            except requests.RequestException:
+                ok = False
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if now < measure_from:
+                continue
+            with lock:
+                if ok:
+                    latencies[name].append(elapsed_ms)
+                else:
+                    errors[name] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(concurrency):
+            pool.submit(worker, i)
+
+    report = {}
+    for name in names:
+        values = sorted(latencies[name])
+        report[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": len(values) / duration,
+            "p50_ms": percentile(values, 50),
+            "p90_ms": percentile(values, 90),
+            "p99_ms": percentile(values, 99),
+            "max_ms": values[-1] if values else 0.0,
+        }
+    return report
+
+
+def print_report(report: Dict[str, Dict]):
+    header = f"{'endpoint':<24} {'reqs':>7} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report.items():
+        print(
+            f"{name:<24} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8.1f} "
+            f"{r['p50_ms']:>8.1f} {r['p90_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}"
+        )
+    total = sum(r["rps"] for r in report.values())
+    print("-" * len(header))
+    print(f"{'total':<24} {'':>7} {'':>5} {total:>8.1f}")
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test for main:app")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--patients", type=int, default=20_000, help="Synthetic cohort size")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use the /async endpoint variants")
+    parser.add_argument("--server-logs", action="store_true", help="Show uvicorn/app logs")
+    args = parser.parse_args(argv)
+
+    proc = None
+    base_url = args.url
+    if not base_url:
+        print(f"Starting main:app with {args.patients} synthetic patients on :{args.port}")
+        proc = start_server(args.port, args.patients, args.seed, args.server_logs)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        print(
+            f"Driving {args.concurrency} clients for {args.duration:.0f}s "
+            f"(+{args.warmup:.0f}s warmup) against {base_url}\n"
+        )
+        report = run_load(
+            base_url, args.concurrency, args.duration, args.warmup, args.seed, args.use_async
+        )
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(
+                {
+                    "concurrency": args.concurrency,
+                    "duration": args.duration,
+                    "async": args.use_async,
+                    "endpoints": report,
+                },
+                f,
+                indent=2,
+            )
+    return 1 if any(r["errors"] for r in report.values()) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(run())
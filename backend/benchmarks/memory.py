@@ -0,0 +1,53 @@
+"""
+Per-patient memory: FHIR-style dicts vs interned PatientRecords.
+
+Reports deep size (shared objects counted once) and the tracemalloc-measured
+allocation of each representation for a synthetic cohort. Records reuse the
+id strings of the dicts they are loaded from, so their allocation column
+excludes ids while their deep size includes them.
+
+    python -m benchmarks.memory --patients 1000000
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from records import deep_sizeof, load_patients
+from synthetic import generate_patients
+
+
+def _allocated(build):
+    """Bytes still allocated after build() returns (result kept alive)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Per-patient memory comparison")
+    parser.add_argument("--patients", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    raw, raw_alloc = _allocated(lambda: generate_patients(args.patients, seed=args.seed))
+    records, records_alloc = _allocated(lambda: load_patients(raw))
+    raw_deep = deep_sizeof(raw)
+    records_deep = deep_sizeof(records)
+
+    n = args.patients
+    print(f"{n} synthetic patients\n")
+    print(f"{'representation':<20} {'deep B/patient':>15} {'alloc B/patient':>16} {'total MB':>10}")
+    for name, deep, alloc in (
+        ("dicts", raw_deep, raw_alloc),
+        ("PatientRecord", records_deep, records_alloc),
+    ):
+        print(f"{name:<20} {deep / n:>15.1f} {alloc / n:>16.1f} {deep / 1e6:>10.1f}")
+    print(f"\nreduction: {raw_deep / records_deep:.1f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,126 @@
+"""
+Bitmap cohorts for AI on FHIR Backend
+A cohort is a Python int used as a bitset over patient rows (bit i set ->
+PATIENTS[i] is a member), so set operations and counts run as single
+big-integer operations instead of rescans of the patient list.
+"""
+
+import datetime
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from records import AgeTable, PatientRecord
+
+try:
+    _bit_count = int.bit_count  # Python 3.10+
+except AttributeError:  # pragma: no cover
+    def _bit_count(bits: int) -> int:
+        return bin(bits).count("1")
+
+
+def popcount(bitmap: int) -> int:
+    return _bit_count(bitmap)
+
+
+def to_bitmap(rows: Iterable[int], size: int) -> int:
+    """Build a bitmap from row numbers in one pass (no quadratic int shifting)."""
+    buf = bytearray((size + 7) // 8)
+    for row in rows:
+        buf[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buf, "little")
+
+
+class BitmapIndex:
+    """
+    Per-attribute bitmaps over a patient list: one per gender and condition
+    display, plus age-group bitmaps per reference date (built
+    from that date's AgeTable on first use, most recent max_dates kept).
+    """
+
+    def __init__(
+        self,
+        patients: List[PatientRecord],
+        age_group: Callable[[int], str],
+        max_dates: int = 4,
+    ):
+        self.size = len(patients)
+        self._age_group = age_group
+        self._max_dates = max_dates
+        self._age_groups: "OrderedDict[datetime.date, Dict[str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        genders: Dict[str, List[int]] = {}
+        conditions: Dict[str, List[int]] = {}
+        for p in patients:
+            genders.setdefault(p.gender, []).append(p.row)
+            for c in p.conditions:
+                conditions.setdefault(c.display, []).append(p.row)
+        self.genders = {k: to_bitmap(v, self.size) for k, v in genders.items()}
+        self.conditions = {k: to_bitmap(v, self.size) for k, v in conditions.items()}
+
+    def age_groups(self, ages: AgeTable) -> Dict[str, int]:
+        """Age-group bitmaps on ages.reference_date (patients not yet born are in none)."""
+        with self._lock:
+            groups = self._age_groups.get(ages.reference_date)
+            if groups is not None:
+                self._age_groups.move_to_end(ages.reference_date)
+                return groups
+            rows: Dict[str, List[int]] = {}
+            for row, age in enumerate(ages.ages):
+                if age >= 0:
+                    rows.setdefault(self._age_group(age), []).append(row)
+            groups = {k: to_bitmap(v, self.size) for k, v in rows.items()}
+            self._age_groups[ages.reference_date] = groups
+            while len(self._age_groups) > self._max_dates:
+                self._age_groups.popitem(last=False)
+            return groups
+
+    def born(self, ages: AgeTable) -> int:
+        """Patients already born on ages.reference_date (the union of the age groups)."""
+        bitmap = 0
+        for rows in self.age_groups(ages).values():
+            bitmap |= rows
+        return bitmap
+
+
+class Cohort:
+    __slots__ = ("id", "name", "bitmap", "definition", "created_at")
+
+    def __init__(self, name: str, bitmap: int, definition: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.bitmap = bitmap
+        self.definition = definition
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+
+class CohortStore:
+    """In-memory saved cohorts; the oldest is evicted beyond max_cohorts."""
+
+    def __init__(self, max_cohorts: int = 100):
+        self.max_cohorts = max_cohorts
+        self._cohorts: "OrderedDict[str, Cohort]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, cohort: Cohort) -> Cohort:
+        with self._lock:
+            self._cohorts[cohort.id] = cohort
+            while len(self._cohorts) > self.max_cohorts:
+                self._cohorts.popitem(last=False)
+        return cohort
+
+    def get(self, cohort_id: str) -> Optional[Cohort]:
+        return self._cohorts.get(cohort_id)
+
+    def remove(self, cohort_id: str) -> bool:
+        with self._lock:
+            return self._cohorts.pop(cohort_id, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cohorts.clear()
+
+    def list(self) -> List[Cohort]:
+        return list(self._cohorts.values())
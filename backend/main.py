@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Literal, Optional, Union
 from fastapi import FastAPI, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import re
+import os
+import math
+import itertools
+import time
+import threading
 import datetime
 import logging
+import numpy as np
 
 # Import static data
 from data import (
@@ -16,6 +23,19 @@ from data import (
     AGE_OPERATORS,
     QUERY_SUGGESTIONS,
 )
+from sampling import StratifiedSample
+from synthetic import generate_patients
+from offload import (
+    MicroBatcher,
+    ThreadBatcher,
+    WorkerError,
+    run_in_process,
+    shutdown_process_pool,
+)
+from records import AgeCache, AgeTable, PatientRecord, load_patients, patients_sizeof
+from cohorts import BitmapIndex, Cohort, CohortStore, popcount, to_bitmap
+from querylog import SlowQueryLog, profile_call
+from pivots import CodedDimension, PivotCodes, pivot_counts
 
 # Try spaCy, fall back to regex
 try:
@@ -29,6 +49,18 @@ except Exception:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Optional synthetic cohort (load tests / benchmarks) in place of the static sample
+if os.getenv("SYNTHETIC_PATIENTS"):
+    PATIENTS: List[PatientRecord] = load_patients(
+        generate_patients(
+            int(os.getenv("SYNTHETIC_PATIENTS")),
+            seed=int(os.getenv("SYNTHETIC_SEED", "0")),
+        )
+    )
+    logger.info(f"Loaded {len(PATIENTS)} synthetic patients")
+else:
+    PATIENTS = load_patients(SAMPLE_PATIENTS)
+
 app = FastAPI(
     title="AI on FHIR Backend",
     version="1.0",
@@ -62,12 +94,27 @@ class ParsedFilters(BaseModel):
 
 class QueryRequest(BaseModel):
     query: str = Field(..., min_length=1)
+    approximate: bool = False
+    profile: bool = False
+    as_of: Optional[datetime.date] = None
+
+
+class ConfidenceInterval(BaseModel):
+    low: int
+    high: int
+    level: float = 0.95
+
+
+class MemoryReport(BaseModel):
+    total_bytes: int
+    bytes_per_patient: float
 
 
 class HealthResponse(BaseModel):
     status: str
     nlp_available: bool
     total_patients: int
+    memory: MemoryReport
 
 
 class PatientSummary(BaseModel):
@@ -94,13 +141,15 @@ class SearchPatientsResponse(BaseModel):
 class QuerySummary(BaseModel):
     total_patients_found: int
     confidence_score: float
-
+    approximate: bool = False
+    confidence_interval: Optional[ConfidenceInterval] = None
 
 
 class AppliedFilters(BaseModel):
     age_filter: Optional[str] = None
     gender_filter: Optional[str] = None
     diagnosis_filter: Optional[List[str]] = None
+    as_of: Optional[datetime.date] = None
 
 
 class QueryResponse(BaseModel):
@@ -117,16 +166,19 @@ class SuggestionResponse(BaseModel):
 class AgeDistribution(BaseModel):
     age_group: str
     count: int
+    confidence_interval: Optional[ConfidenceInterval] = None
 
 
 class GenderDistribution(BaseModel):
     gender: str
     count: int
+    confidence_interval: Optional[ConfidenceInterval] = None
 
 
 class ConditionDistribution(BaseModel):
     condition: str
     count: int
+    confidence_interval: Optional[ConfidenceInterval] = None
 
 
 class ChartDataResponse(BaseModel):
@@ -134,6 +186,84 @@ class ChartDataResponse(BaseModel):
     gender_distribution: List[GenderDistribution]
     condition_distribution: List[ConditionDistribution]
     total_patients: int
+    approximate: bool = False
+    confidence_interval: Optional[ConfidenceInterval] = None
+
+
+class CohortCreateRequest(BaseModel):
+    name: str = Field(..., min_length=1)
+    query: Optional[str] = None
+    age_filter: Optional[str] = None
+    gender_filter: Optional[str] = None
+    diagnosis_filter: Optional[Union[str, List[str]]] = None
+    as_of: Optional[datetime.date] = None
+
+
+class CohortCombineRequest(BaseModel):
+    name: str = Field(..., min_length=1)
+    op: Literal["union", "intersection", "difference"]
+    cohort_ids: List[str] = Field(..., min_length=2)
+
+
+class CohortSummary(BaseModel):
+    id: str
+    name: str
+    count: int
+    definition: Dict[str, Any]
+    created_at: datetime.datetime
+
+
+class CohortListResponse(BaseModel):
+    cohorts: List[CohortSummary]
+
+
+class PivotRow(BaseModel):
+    keys: Dict[str, str]
+    count: int
+
+
+class PivotTable(BaseModel):
+    index: List[str]
+    columns: List[str]
+    values: List[List[int]]
+
+
+class PivotResponse(BaseModel):
+    group_by: List[str]
+    age_buckets: Optional[List[str]] = None
+    rows: List[PivotRow]
+    pivot: PivotTable
+    total_patients: int
+
+
+class QueryProfile(BaseModel):
+    query: str
+    elapsed_ms: float
+    captured_at: datetime.datetime
+    report: str
+
+
+class SlowQueryEntry(BaseModel):
+    fingerprint: str
+    shape: Dict[str, Any]
+    count: int
+    slow_count: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    mean_rows: float
+    max_rows: int
+    last_query: str
+    last_seen: datetime.datetime
+    last_profile: Optional[QueryProfile] = None
+
+
+class SlowQueryLogResponse(BaseModel):
+    threshold_ms: float
+    profile_sample_rate: float
+    fingerprints: List[SlowQueryEntry]
 
 
 class FilterOption(BaseModel):
@@ -148,18 +278,27 @@ class FilterOptionsResponse(BaseModel):
 
 
 # --- Utilities ---
-def calculate_age(
-    birth_date: str, reference_date: Optional[datetime.date] = None
-) -> int:
-    """Calculate age from birth date relative to reference_date (defaults to today)."""
-    bd = datetime.datetime.strptime(birth_date, "%Y-%m-%d").date()
-    if reference_date is None:
-        reference_date = datetime.date.today()
-    return (
-        reference_date.year
-        - bd.year
-        - ((reference_date.month, reference_date.day) < (bd.month, bd.day))
-    )
+# Derived per-row ages for recently used reference dates ("today" included)
+AGE_CACHE = AgeCache(max_dates=int(os.getenv("AGE_CACHE_DATES", "8")))
+
+
+def get_ages(as_of: Optional[datetime.date] = None) -> AgeTable:
+    """Ages of all PATIENTS on as_of (default today), indexed by PatientRecord.row."""
+    return AGE_CACHE.get(PATIENTS, as_of or datetime.date.today())
+
+
+AGE_GROUPS = ("0-30", "31-50", "51-70", "71+")
+
+
+def age_bucket(age: int) -> str:
+    """Map an age onto the chart_data age groups."""
+    if age <= 30:
+        return "0-30"
+    elif age <= 50:
+        return "31-50"
+    elif age <= 70:
+        return "51-70"
+    return "71+"
 
 
 def is_diabetes_query(text_lower: str) -> bool:
@@ -199,9 +338,54 @@ def get_diabetes_codes() -> List[str]:
     return sorted(codes)
 
 
-def parse_query(query: str) -> ParsedFilters:
-    """Parse natural language query using spaCy or regex fallback"""
+def extract_nlp_hints(doc) -> Dict[str, Any]:
+    """Reduce a spaCy Doc to the plain (picklable) hints parse_query uses."""
+    return {"lemmas": " ".join(token.lemma_.lower() for token in doc)}
+
+
+# spaCy runs once per batch of concurrent queries, on both the sync and async routes
+NLP_BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "32"))
+NLP_BATCH_WAIT_MS = float(os.getenv("NLP_BATCH_WAIT_MS", "5"))
+
+_sync_nlp_batcher: Optional[ThreadBatcher] = None
+_sync_nlp_batcher_lock = threading.Lock()
+
+
+def _extract_nlp_hints_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    return [extract_nlp_hints(doc) for doc in nlp.pipe(texts, batch_size=len(texts))]
+
+
+def get_nlp_hints(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Lemma hints for `query` from sync handlers, micro-batched across threads
+    like the async endpoints; None when spaCy is unavailable.
+    """
+    global _sync_nlp_batcher
+    if not NLP_AVAILABLE:
+        return None
+    with _sync_nlp_batcher_lock:
+        if _sync_nlp_batcher is None:
+            _sync_nlp_batcher = ThreadBatcher(
+                _extract_nlp_hints_batch,
+                max_batch=NLP_BATCH_SIZE,
+                max_wait=NLP_BATCH_WAIT_MS / 1000,
+            )
+    return _sync_nlp_batcher.submit(query)
+
+
+def parse_query(query: str, nlp_hints: Optional[Dict[str, Any]] = None) -> ParsedFilters:
+    """
+    Parse natural language query with keyword and regex rules.
+
+    `nlp_hints` (from extract_nlp_hints) are only used when the caller
+    supplies them; handlers get them batched across requests
+    (get_nlp_hints, or the async MicroBatcher) rather than running spaCy
+    here once per query.
+    """
     text_lower = query.lower()
+    # Keyword matching also sees lemmas ("females" -> "female", "women" -> "woman"),
+    # matched as a separate text so no keyword can span the query/lemma join
+    keyword_texts = [text_lower] + ([nlp_hints["lemmas"]] if nlp_hints else [])
     result = {
         "raw_text": query,
         "age": None,
@@ -212,19 +396,19 @@ def parse_query(query: str) -> ParsedFilters:
 
     # Gender detection
     for keyword, gender in GENDER_KEYWORDS.items():
-        if re.search(rf"\b{re.escape(keyword)}\b", text_lower):
+        if any(re.search(rf"\b{re.escape(keyword)}\b", text) for text in keyword_texts):
             result["gender"] = gender
             break
 
     # Diagnosis detection (with diabetes prioritization to avoid overbroad matches)
     diagnosed = set()
-    if is_diabetes_query(text_lower):
+    if any(is_diabetes_query(text) for text in keyword_texts):
         # If query explicitly references diabetes, restrict to diabetes codes only.
         diagnosed.update(get_diabetes_codes())
     else:
         # Normal matching across DIAGNOSIS_KEYWORDS
         for keyword, codes in DIAGNOSIS_KEYWORDS.items():
-            if keyword in text_lower:
+            if any(keyword in text for text in keyword_texts):
                 diagnosed.update(codes)
 
     result["diagnoses"] = sorted(list(diagnosed))
@@ -257,43 +441,39 @@ def parse_query(query: str) -> ParsedFilters:
     )
     result["confidence"] = min(1.0, 0.4 + (found * 0.2))
 
-    logger.info(f"Parsed: {result}")
+    logger.debug(f"Parsed: {result}")
     return ParsedFilters(**result)
 
 
 def _validate_system_date_against_data(
-    reference_date: datetime.date, patients: List[Dict]
+    ages: AgeTable, patients: List[PatientRecord]
 ) -> bool:
     """
     Ensure system reference_date is sensible relative to patient birth dates.
     Returns True if date is OK; False if there is at least one birthDate in the future
     compared to reference_date (indicates clock problem or bad data).
+    Birth dates are parsed (and malformed ones rejected) by load_patients.
     """
+    if not ages.has_unborn:
+        return True
+    reference_date = ages.reference_date
     for p in patients:
-        try:
-            bd = datetime.datetime.strptime(p["birthDate"], "%Y-%m-%d").date()
-            if bd > reference_date:
-                logger.warning(
-                    f"Patient {p.get('id')} has birthDate {bd} which is after reference date {reference_date}. Skipping age-based filtering."
-                )
-                return False
-        except Exception as exc:
-            logger.exception(f"Bad birthDate for patient {p.get('id')}: {exc}")
+        if p.birth_date > reference_date:
+            logger.warning(
+                f"Patient {p.id} has birthDate {p.birth_date} which is after reference date {reference_date}. Skipping age-based filtering."
+            )
             return False
     return True
 
 
-def _apply_age_filter(patients: List[Dict], age_filter: str, today: datetime.date) -> List[Dict]:
-    """Apply age filter logic to patient list."""
+def _age_predicate(age_filter: str) -> Optional[Callable[[int], bool]]:
+    """Parse an age filter ("30-50", ">60", "<=70", "60+", "60") into a test on age; None if unrecognized."""
     # Range like "30-50"
     if "-" in age_filter and age_filter.count("-") == 1 and age_filter.split("-")[0].isdigit():
         low_s, high_s = age_filter.split("-")
         low, high = int(low_s), int(high_s)
-        return [
-            p for p in patients
-            if low <= calculate_age(p["birthDate"], reference_date=today) <= high
-        ]
-    
+        return lambda age: low <= age <= high
+
     # Operator-prefixed filters: e.g. ">60", ">=60", "<=70", "<50"
     m = re.match(r"^(>=|<=|>|<)?\s*(\d{1,3})\+?$", age_filter.strip())
     if m:
@@ -305,77 +485,234 @@ def _apply_age_filter(patients: List[Dict], age_filter: str, today: datetime.dat
             "<": lambda age: age < age_val,
             "<=": lambda age: age <= age_val,
         }
-        return [
-            p for p in patients
-            if ops[op](calculate_age(p["birthDate"], reference_date=today))
-        ]
-    
+        return ops[op]
+
     # Fallback: "60+" or exact age "60"
     if age_filter.endswith("+") and age_filter[:-1].isdigit():
         min_age = int(age_filter[:-1])
-        return [
-            p for p in patients
-            if calculate_age(p["birthDate"], reference_date=today) >= min_age
-        ]
+        return lambda age: age >= min_age
     elif age_filter.isdigit():
         age_val = int(age_filter)
-        return [
-            p for p in patients
-            if calculate_age(p["birthDate"], reference_date=today) == age_val
-        ]
-    
-    return patients
+        return lambda age: age == age_val
+
+    return None
+
+
+def _apply_age_filter(
+    patients: List[PatientRecord], age_filter: str, ages: AgeTable
+) -> List[PatientRecord]:
+    """Apply age filter logic to patient list."""
+    matches = _age_predicate(age_filter)
+    if matches is None:
+        return patients
+    age_of = ages.ages
+    return [p for p in patients if matches(age_of[p.row])]
 
 
 def filter_patients(
     age_filter: Optional[str] = None,
     gender_filter: Optional[str] = None,
     diagnosis_filter: Optional[Union[str, List[str]]] = None,
-) -> List[Dict]:
-    """Apply filters to patient dataset."""
-    patients = SAMPLE_PATIENTS.copy()
+    patients: Optional[List[PatientRecord]] = None,
+    as_of: Optional[datetime.date] = None,
+) -> List[PatientRecord]:
+    """
+    Apply filters to patient dataset (or to `patients`, e.g. the approximate sample).
+    Ages are taken on `as_of` (default today); patients born after an explicit
+    as_of are excluded, since they were not yet patients on that date.
+    """
+    patients = list(PATIENTS if patients is None else patients)
 
     # Gender filter
     if gender_filter:
-        patients = [p for p in patients if p.get("gender") == gender_filter]
+        patients = [p for p in patients if p.gender == gender_filter]
 
     # Diagnosis filter (support list)
     if diagnosis_filter:
         diag_codes = {diagnosis_filter} if isinstance(diagnosis_filter, str) else set(diagnosis_filter)
         patients = [
             p for p in patients
-            if any(c.get("code") in diag_codes for c in p.get("conditions", []))
+            if any(c.code in diag_codes for c in p.conditions)
         ]
 
+    # As-of date: drop patients not yet born
+    if as_of is not None:
+        ages = get_ages(as_of)
+        if ages.has_unborn:
+            patients = [p for p in patients if ages.ages[p.row] >= 0]
+
     # Age filter
     if age_filter:
-        today = datetime.date.today()
-        if not _validate_system_date_against_data(today, patients):
+        ages = get_ages(as_of)
+        if as_of is None and not _validate_system_date_against_data(ages, patients):
             logger.error("System date out-of-sync with patient birth dates. Age filter skipped.")
             return patients
         
-        patients = _apply_age_filter(patients, age_filter, today)
+        patients = _apply_age_filter(patients, age_filter, ages)
 
     return patients
 
 
+# --- Approximate analytics ---
+APPROX_SAMPLE_RATE = float(os.getenv("APPROX_SAMPLE_RATE", "0.01"))
+APPROX_MIN_PER_STRATUM = int(os.getenv("APPROX_MIN_PER_STRATUM", "30"))
+
+_approx_sample: Optional[StratifiedSample] = None
+_approx_sample_source: Optional[tuple] = None
+_approx_conditions: List[str] = []  # every condition display in PATIENTS
+_approx_sample_date: Optional[datetime.date] = None  # date the age strata were taken on
+_approx_age_spans: Dict[str, tuple] = {}  # age group -> (youngest, oldest) on that date
+
+
+def get_approximate_sample() -> StratifiedSample:
+    """
+    Return the stratified (gender x age group) sample of PATIENTS,
+    rebuilding it whenever the dataset has been replaced or resized.
+    """
+    global _approx_sample, _approx_sample_source, _approx_conditions
+    global _approx_sample_date, _approx_age_spans
+    source = (id(PATIENTS), len(PATIENTS))
+    if _approx_sample is None or _approx_sample_source != source:
+        age_table = get_ages()
+        ages = age_table.ages
+        _approx_conditions = sorted({c.display for p in PATIENTS for c in p.conditions})
+        _approx_sample_date = age_table.reference_date
+        spans: Dict[str, tuple] = {}
+        for age in set(ages):
+            group = age_bucket(age)
+            low, high = spans.get(group, (age, age))
+            spans[group] = (min(low, age), max(high, age))
+        _approx_age_spans = spans
+        _approx_sample = StratifiedSample(
+            PATIENTS,
+            strata_key=lambda p: (p.gender, age_bucket(ages[p.row])),
+            rate=APPROX_SAMPLE_RATE,
+            min_per_stratum=APPROX_MIN_PER_STRATUM,
+        )
+        _approx_sample_source = source
+        logger.info(
+            f"Built approximate sample: {len(_approx_sample.patients)} of "
+            f"{_approx_sample.population_size} patients"
+        )
+    return _approx_sample
+
+
+def _approx_known(
+    age_filter: Optional[str],
+    gender_filter: Optional[str],
+    diagnosis_filter: Optional[Union[str, List[str]]],
+    as_of: Optional[datetime.date] = None,
+) -> Callable[[tuple, Any], Optional[bool]]:
+    """
+    `known` callback for StratifiedSample.estimate_counts on the (gender, age
+    group) strata: True / False when the stratum key alone decides that every /
+    no member passes the filters with the label, None when the sample must.
+    Labels are None (the total) or (kind, value) as in _approximate_chart_data.
+    Age decisions only hold on the date the strata were taken on.
+    """
+    ages_fixed = (as_of or datetime.date.today()) == _approx_sample_date
+    # Unborn patients make filter_patients drop rows (as_of) or skip the age filter
+    has_unborn = any(low < 0 for low, _ in _approx_age_spans.values())
+    age_groups_pass: Dict[str, Optional[bool]] = {}
+    matches_age = _age_predicate(age_filter) if age_filter else None
+    for group, (low, high) in _approx_age_spans.items():
+        if not age_filter and as_of is None:
+            age_groups_pass[group] = True
+        elif not ages_fixed or has_unborn:
+            age_groups_pass[group] = None
+        elif matches_age is None:
+            age_groups_pass[group] = True
+        else:
+            passes = {matches_age(age) for age in range(low, high + 1)}
+            age_groups_pass[group] = passes.pop() if len(passes) == 1 else None
+
+    def known(stratum: tuple, label: Any) -> Optional[bool]:
+        gender, group = stratum
+        kind, value = label if label is not None else ("total", None)
+        if (gender_filter and gender != gender_filter) or (kind == "gender" and value != gender):
+            return False
+        decided = age_groups_pass.get(group)
+        if kind == "age" and ages_fixed and value != group:
+            return False
+        if decided is False:
+            return False
+        if decided is None or diagnosis_filter or kind == "condition":
+            return None
+        return True
+
+    return known
+
+
+def _interval(estimate) -> Dict[str, int]:
+    """Round an Estimate's bounds outwards so the interval never shrinks."""
+    return {"low": math.floor(estimate.low), "high": math.ceil(estimate.high)}
+
+
 # --- API Endpoints ---
+def get_memory_report(patients: List[PatientRecord]) -> Dict[str, Any]:
+    """Deep size of a patient list (shared/interned objects counted once)."""
+    total = patients_sizeof(patients)
+    return {
+        "total_bytes": total,
+        "bytes_per_patient": round(total / max(len(patients), 1), 1),
+    }
+
+
+# Sized once at load time, so /health (a liveness probe) never walks the dataset
+MEMORY_REPORT = get_memory_report(PATIENTS)
+
+
 @app.get("/health", response_model=HealthResponse)
 def health():
     """Health check"""
     return {
         "status": "ok",
         "nlp_available": NLP_AVAILABLE,
-        "total_patients": len(SAMPLE_PATIENTS),
+        "total_patients": len(PATIENTS),
+        "memory": MEMORY_REPORT,
     }
 
 
+# Per-fingerprint latency stats for /query (see querylog.py)
+SLOW_QUERY_LOG = SlowQueryLog(
+    threshold_ms=float(os.getenv("SLOW_QUERY_MS", "250")),
+    max_fingerprints=int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", "500")),
+    profile_sample_rate=float(os.getenv("QUERY_PROFILE_SAMPLE_RATE", "0")),
+)
+
+
+def _log_query(
+    body: QueryRequest, response: Dict[str, Any], started: float, profile: Optional[str]
+) -> None:
+    SLOW_QUERY_LOG.record(
+        response["parsed_filters"],
+        body.query,
+        (time.perf_counter() - started) * 1000,
+        response["summary"]["total_patients_found"],
+        profile,
+        approximate=body.approximate,
+        as_of=body.as_of is not None,
+    )
+
+
 @app.post("/query", response_model=QueryResponse)
 def query_endpoint(body: QueryRequest):
     """Parse natural language query and return parsed filters + summary"""
-    filters = parse_query(body.query)
+    started = time.perf_counter()
+    profile = None
+    nlp_hints = get_nlp_hints(body.query)
+    if SLOW_QUERY_LOG.should_profile(body.profile):
+        response, profile = profile_call(
+            run_query, body.query, body.approximate, nlp_hints, body.as_of
+        )
+    else:
+        response = run_query(body.query, body.approximate, nlp_hints, body.as_of)
+    _log_query(body, response, started, profile)
+    return response
+
 
-    # Convert to filter parameters (keep operator semantics explicit)
+def to_applied_filters(filters: ParsedFilters) -> Dict[str, Any]:
+    """Convert parsed filters to filter_patients parameters (keep operator semantics explicit)."""
     applied = {}
     if filters.age:
         if filters.age.op == "between":
@@ -397,26 +734,60 @@ def query_endpoint(body: QueryRequest):
         # pass the full diagnosis list (not just the first) to avoid dropping potential matches
         applied["diagnosis_filter"] = filters.diagnoses
 
-    # Count matches
+    return applied
+
+
+def run_query(
+    query: str,
+    approximate: bool = False,
+    nlp_hints: Optional[Dict[str, Any]] = None,
+    as_of: Optional[datetime.date] = None,
+) -> Dict[str, Any]:
+    """Body of /query, kept top-level so the async variant can run it in a worker process."""
+    filters = parse_query(query, nlp_hints)
+    applied = to_applied_filters(filters)
+    if as_of is not None:
+        applied["as_of"] = as_of
+
+    # Count matches (against the stratified sample when approximate)
+    sample = get_approximate_sample() if approximate else None
     try:
         matching = filter_patients(
             age_filter=applied.get("age_filter"),
             gender_filter=applied.get("gender_filter"),
             diagnosis_filter=applied.get("diagnosis_filter"),
+            patients=sample.patients if sample else None,
+            as_of=as_of,
         )
     except Exception as exc:
         # If age validation failed or similar, return an error with explanation
         logger.exception("Error filtering patients")
         raise HTTPException(status_code=500, detail=str(exc))
 
+    summary = {
+        "total_patients_found": len(matching),
+        "confidence_score": filters.confidence,
+    }
+    if sample:
+        estimate = sample.estimate_counts(
+            matching,
+            expected_labels=[None],
+            known=_approx_known(
+                applied.get("age_filter"),
+                applied.get("gender_filter"),
+                applied.get("diagnosis_filter"),
+                as_of,
+            ),
+        )[None]
+        summary["approximate"] = True
+        summary["total_patients_found"] = round(estimate.count)
+        summary["confidence_interval"] = _interval(estimate)
+
     return {
         "parsed_filters": filters,
         "applied_filters": applied,
-        "summary": {
-            "total_patients_found": len(matching),
-            "confidence_score": filters.confidence,
-        },
-        "results_sample": matching[:10],
+        "summary": summary,
+        "results_sample": [p.to_dict() for p in matching[:10]],
     }
 
 
@@ -436,33 +807,31 @@ def chart_data(
     age_filter: Optional[str] = None,
     gender_filter: Optional[str] = None,
     diagnosis_filter: Optional[str] = None,
+    approximate: bool = False,
+    as_of: Optional[datetime.date] = None,
 ):
     """Get aggregated data for charts (no PII)"""
-    patients = filter_patients(age_filter, gender_filter, diagnosis_filter)
+    if approximate:
+        return _approximate_chart_data(age_filter, gender_filter, diagnosis_filter, as_of)
+
+    patients = filter_patients(age_filter, gender_filter, diagnosis_filter, as_of=as_of)
 
     # Age distribution
     age_buckets = {"0-30": 0, "31-50": 0, "51-70": 0, "71+": 0}
+    ages = get_ages(as_of).ages
     for p in patients:
-        age = calculate_age(p["birthDate"])
-        if age <= 30:
-            age_buckets["0-30"] += 1
-        elif age <= 50:
-            age_buckets["31-50"] += 1
-        elif age <= 70:
-            age_buckets["51-70"] += 1
-        else:
-            age_buckets["71+"] += 1
+        age_buckets[age_bucket(ages[p.row])] += 1
 
     # Gender distribution
     gender_dist = {"male": 0, "female": 0}
     for p in patients:
-        gender_dist[p["gender"]] += 1
+        gender_dist[p.gender] += 1
 
     # Condition distribution
     condition_counts = {}
     for p in patients:
-        for c in p["conditions"]:
-            condition_counts[c["display"]] = condition_counts.get(c["display"], 0) + 1
+        for c in p.conditions:
+            condition_counts[c.display] = condition_counts.get(c.display, 0) + 1
 
     return {
         "age_distribution": [
@@ -479,6 +848,170 @@ def chart_data(
     }
 
 
+def _approximate_chart_data(
+    age_filter: Optional[str],
+    gender_filter: Optional[str],
+    diagnosis_filter: Optional[str],
+    as_of: Optional[datetime.date] = None,
+) -> Dict[str, Any]:
+    """chart_data answered from the stratified sample, with 95% intervals per count."""
+    sample = get_approximate_sample()
+    patients = filter_patients(
+        age_filter, gender_filter, diagnosis_filter, patients=sample.patients, as_of=as_of
+    )
+    ages = get_ages(as_of).ages
+    estimates = sample.estimate_counts(
+        patients,
+        labels=lambda p: [
+            ("total", None),
+            ("age", age_bucket(ages[p.row])),
+            ("gender", p.gender),
+        ]
+        + [("condition", c.display) for c in p.conditions],
+        # Unseen groups still get an estimate (0) with a non-zero upper bound
+        expected_labels=[("total", None)]
+        + [("age", k) for k in AGE_GROUPS]
+        + [("gender", k) for k in ("male", "female")]
+        + [("condition", k) for k in _approx_conditions],
+        # Groups the strata decide (e.g. age groups, filtered-out genders) are exact
+        known=_approx_known(age_filter, gender_filter, diagnosis_filter, as_of),
+    )
+
+    def entry(kind: str, value: Optional[str]) -> Dict[str, Any]:
+        estimate = estimates[(kind, value)]
+        return {"count": round(estimate.count), "confidence_interval": _interval(estimate)}
+
+    conditions = sorted(
+        (value for kind, value in estimates if kind == "condition"),
+        key=lambda value: (-estimates[("condition", value)].count, value),
+    )
+    total = entry("total", None)
+    return {
+        "age_distribution": [
+            {"age_group": k, **entry("age", k)} for k in AGE_GROUPS
+        ],
+        "gender_distribution": [
+            {"gender": k.capitalize(), **entry("gender", k)} for k in ("male", "female")
+        ],
+        "condition_distribution": [
+            {"condition": k, **entry("condition", k)} for k in conditions
+        ],
+        "total_patients": total["count"],
+        "approximate": True,
+        "confidence_interval": total["confidence_interval"],
+    }
+
+
+PIVOT_DIMENSIONS = ("age", "gender", "condition", "medication")
+_pivot_codes: Optional[PivotCodes] = None
+_pivot_codes_source: Optional[tuple] = None
+DEFAULT_AGE_BOUNDARIES = [31, 51, 71]  # same groups as chart_data
+
+
+def parse_age_boundaries(age_bins: Optional[str]) -> List[int]:
+    """Parse "18,40,65" into strictly increasing bucket lower bounds."""
+    if not age_bins:
+        return list(DEFAULT_AGE_BOUNDARIES)
+    try:
+        boundaries = [int(b) for b in age_bins.split(",") if b.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid age_bins: {age_bins!r}")
+    if not boundaries or any(b <= 0 for b in boundaries) or boundaries != sorted(set(boundaries)):
+        raise HTTPException(
+            status_code=400,
+            detail="age_bins must be strictly increasing positive integers",
+        )
+    return boundaries
+
+
+def age_bucket_labels(boundaries: List[int]) -> List[str]:
+    """Labels for the len(boundaries) + 1 buckets: [31, 51, 71] -> 0-30, 31-50, 51-70, 71+."""
+    edges = [0] + boundaries
+    return [f"{lo}-{hi - 1}" for lo, hi in zip(edges, boundaries)] + [f"{boundaries[-1]}+"]
+
+
+def get_pivot_codes() -> PivotCodes:
+    """Return the integer-coded pivot dimensions for PATIENTS, rebuilt if the dataset changed."""
+    global _pivot_codes, _pivot_codes_source
+    source = (id(PATIENTS), len(PATIENTS))
+    if _pivot_codes is None or _pivot_codes_source != source:
+        _pivot_codes = PivotCodes(PATIENTS)
+        _pivot_codes_source = source
+    return _pivot_codes
+
+
+def _pivot_table(
+    group_by: List[str], counts: Dict[tuple, int], orders: Dict[str, List[str]]
+) -> Dict[str, Any]:
+    """Wide table: first dimension as rows, remaining dimensions (joined with " | ") as columns."""
+    index = orders[group_by[0]]
+    if len(group_by) == 1:
+        return {
+            "index": index,
+            "columns": ["count"],
+            "values": [[counts.get((i,), 0)] for i in index],
+        }
+    columns = list(itertools.product(*(orders[d] for d in group_by[1:])))
+    return {
+        "index": index,
+        "columns": [" | ".join(c) for c in columns],
+        "values": [[counts.get((i,) + c, 0) for c in columns] for i in index],
+    }
+
+
+@app.get("/analytics/pivot", response_model=PivotResponse)
+def pivot(
+    group_by: str = Query(..., description="Comma-separated: age, gender, condition, medication"),
+    age_bins: Optional[str] = Query(
+        default=None, description="Age bucket lower bounds, e.g. 18,40,65 (default 31,51,71)"
+    ),
+    age_filter: Optional[str] = None,
+    gender_filter: Optional[str] = None,
+    diagnosis_filter: Optional[str] = None,
+    as_of: Optional[datetime.date] = None,
+):
+    """
+    Group filtered patients by any combination of dimensions and count them (no PII).
+
+    Counts come from one bincount over integer-coded keys (see pivots.py).
+    Condition (code) and medication are multi-valued, so a patient counts
+    once under each of theirs.
+    """
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    unknown = [d for d in dims if d not in PIVOT_DIMENSIONS]
+    if not dims or unknown or len(set(dims)) != len(dims):
+        raise HTTPException(
+            status_code=400,
+            detail=f"group_by must be distinct values from {', '.join(PIVOT_DIMENSIONS)}",
+        )
+    boundaries = parse_age_boundaries(age_bins)
+    labels = age_bucket_labels(boundaries)
+
+    patients = filter_patients(age_filter, gender_filter, diagnosis_filter, as_of=as_of)
+    selected = np.fromiter((p.row for p in patients), dtype=np.int64, count=len(patients))
+    dimensions = get_pivot_codes().dimensions
+    if "age" in dims:
+        ages = np.frombuffer(get_ages(as_of).ages, dtype=np.int16)
+        buckets = np.searchsorted(boundaries, ages, side="right").astype(np.int32)
+        dimensions = {**dimensions, "age": CodedDimension.single(buckets, labels)}
+    counts = pivot_counts(selected, [dimensions[d] for d in dims])
+
+    orders = {d: sorted({key[i] for key in counts}) for i, d in enumerate(dims)}
+    if "age" in orders:
+        orders["age"] = labels
+    if "gender" in orders:
+        orders["gender"] = sorted(set(orders["gender"]) | {"male", "female"})
+    # pivot_counts iterates in code order: age by bucket, the rest alphabetically
+    rows = [{"keys": dict(zip(dims, key)), "count": count} for key, count in counts.items()]
+    return {
+        "group_by": dims,
+        "age_buckets": labels if "age" in dims else None,
+        "rows": rows,
+        "pivot": _pivot_table(dims, counts, orders),
+        "total_patients": len(patients),
+    }
+
+
 @app.get("/patients/search", response_model=SearchPatientsResponse)
 def search_patients(
     age_filter: Optional[str] = None,
@@ -486,23 +1019,25 @@ def search_patients(
     diagnosis_filter: Optional[str] = None,
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=10, ge=1, le=50),
+    as_of: Optional[datetime.date] = None,
 ):
     """Search patients with pagination (for table display)"""
-    patients = filter_patients(age_filter, gender_filter, diagnosis_filter)
+    patients = filter_patients(age_filter, gender_filter, diagnosis_filter, as_of=as_of)
+    ages = get_ages(as_of).ages
 
     # Format for table
     table_data = []
     for p in patients:
         table_data.append(
             {
-                "id": p["id"],
-                "name": f"{p['name']['given'][0]} {p['name']['family']}",
-                "age": calculate_age(p["birthDate"]),
-                "gender": p["gender"].capitalize(),
+                "id": p.id,
+                "name": p.display_name,
+                "age": ages[p.row],
+                "gender": p.gender.capitalize(),
                 "primary_condition": (
-                    p["conditions"][0]["display"] if p["conditions"] else "None"
+                    p.conditions[0].display if p.conditions else "None"
                 ),
-                "medications": ", ".join(p.get("medications", [])),
+                "medications": ", ".join(p.medications),
             }
         )
 
@@ -527,9 +1062,9 @@ def search_patients(
 def filter_options():
     """Get available filter options for dropdowns"""
     all_conditions = {}
-    for p in SAMPLE_PATIENTS:
-        for c in p["conditions"]:
-            all_conditions[c["code"]] = c["display"]
+    for p in PATIENTS:
+        for c in p.conditions:
+            all_conditions[c.code] = c.display
 
     return {
         "age_ranges": [
@@ -549,6 +1084,242 @@ def filter_options():
     }
 
 
+# --- Admin ---
+@app.get("/admin/slow-queries", response_model=SlowQueryLogResponse)
+def slow_queries():
+    """Per-fingerprint /query latency and row-count statistics, most expensive first"""
+    return {
+        "threshold_ms": SLOW_QUERY_LOG.threshold_ms,
+        "profile_sample_rate": SLOW_QUERY_LOG.profile_sample_rate,
+        "fingerprints": SLOW_QUERY_LOG.snapshot(),
+    }
+
+
+@app.delete("/admin/slow-queries")
+def reset_slow_queries():
+    """Clear the slow-query statistics"""
+    SLOW_QUERY_LOG.reset()
+    return {"reset": True}
+
+
+# --- Saved cohorts ---
+# Cohorts are bitmaps over PATIENTS rows: creating one scans patients once, then
+# set operations, counts and chart aggregates run on the bitmaps alone.
+COHORTS = CohortStore(max_cohorts=int(os.getenv("MAX_COHORTS", "100")))
+
+_bitmap_index: Optional[BitmapIndex] = None
+_bitmap_index_source: Optional[tuple] = None
+_bitmap_index_lock = threading.Lock()
+
+
+def get_bitmap_index() -> BitmapIndex:
+    """Return the attribute bitmaps for PATIENTS, rebuilding (and dropping saved cohorts) if the dataset changed."""
+    global _bitmap_index, _bitmap_index_source
+    source = (id(PATIENTS), len(PATIENTS))
+    # Build under the lock: a racing second build would clear cohorts saved against the first
+    with _bitmap_index_lock:
+        if _bitmap_index is None or _bitmap_index_source != source:
+            _bitmap_index = BitmapIndex(PATIENTS, age_group=age_bucket)
+            _bitmap_index_source = source
+            COHORTS.clear()
+        return _bitmap_index
+
+
+def _cohort_summary(cohort: Cohort) -> Dict[str, Any]:
+    return {
+        "id": cohort.id,
+        "name": cohort.name,
+        "count": popcount(cohort.bitmap),
+        "definition": cohort.definition,
+        "created_at": cohort.created_at,
+    }
+
+
+def _get_cohort(cohort_id: str) -> Cohort:
+    cohort = COHORTS.get(cohort_id)
+    if cohort is None:
+        raise HTTPException(status_code=404, detail=f"Cohort {cohort_id} not found")
+    return cohort
+
+
+@app.post("/cohorts", response_model=CohortSummary)
+def create_cohort(body: CohortCreateRequest):
+    """Save a cohort from a natural language query or explicit filters"""
+    index = get_bitmap_index()
+    if body.query:
+        applied = to_applied_filters(parse_query(body.query, get_nlp_hints(body.query)))
+        if body.as_of is not None:
+            applied["as_of"] = body.as_of
+        definition = {"query": body.query, "applied_filters": applied}
+    else:
+        applied = {
+            k: v
+            for k, v in (
+                ("age_filter", body.age_filter),
+                ("gender_filter", body.gender_filter),
+                ("diagnosis_filter", body.diagnosis_filter),
+            )
+            if v
+        }
+        if body.as_of is not None:
+            applied["as_of"] = body.as_of
+        definition = {"applied_filters": applied}
+
+    matching = filter_patients(**applied)
+    cohort = Cohort(body.name, to_bitmap((p.row for p in matching), index.size), definition)
+    return _cohort_summary(COHORTS.add(cohort))
+
+
+@app.post("/cohorts/combine", response_model=CohortSummary)
+def combine_cohorts(body: CohortCombineRequest):
+    """Save the union / intersection / difference (first minus the rest) of saved cohorts"""
+    bitmaps = [_get_cohort(cohort_id).bitmap for cohort_id in body.cohort_ids]
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        if body.op == "union":
+            result |= bitmap
+        elif body.op == "intersection":
+            result &= bitmap
+        else:
+            result &= ~bitmap
+    definition = {"op": body.op, "cohort_ids": body.cohort_ids}
+    return _cohort_summary(COHORTS.add(Cohort(body.name, result, definition)))
+
+
+@app.get("/cohorts", response_model=CohortListResponse)
+def list_cohorts():
+    """List saved cohorts"""
+    return {"cohorts": [_cohort_summary(c) for c in COHORTS.list()]}
+
+
+@app.get("/cohorts/{cohort_id}", response_model=CohortSummary)
+def get_cohort(cohort_id: str):
+    """Saved cohort definition and patient count"""
+    return _cohort_summary(_get_cohort(cohort_id))
+
+
+@app.delete("/cohorts/{cohort_id}")
+def delete_cohort(cohort_id: str):
+    """Delete a saved cohort"""
+    if not COHORTS.remove(cohort_id):
+        raise HTTPException(status_code=404, detail=f"Cohort {cohort_id} not found")
+    return {"deleted": cohort_id}
+
+
+@app.get("/cohorts/{cohort_id}/chart-data", response_model=ChartDataResponse)
+def cohort_chart_data(cohort_id: str, as_of: Optional[datetime.date] = None):
+    """
+    chart_data aggregates for a saved cohort, computed from bitmaps (no PII).
+
+    With an explicit as_of, members not yet born on that date are left out of
+    every aggregate, as in filter_patients.
+    """
+    bitmap = _get_cohort(cohort_id).bitmap
+    index = get_bitmap_index()
+    ages = get_ages(as_of)
+    age_groups = index.age_groups(ages)
+    if as_of is not None and ages.has_unborn:
+        bitmap &= index.born(ages)
+
+    condition_counts = {
+        display: count
+        for display, count in (
+            (display, popcount(bitmap & rows)) for display, rows in index.conditions.items()
+        )
+        if count
+    }
+    return {
+        "age_distribution": [
+            {"age_group": k, "count": popcount(bitmap & age_groups.get(k, 0))}
+            for k in AGE_GROUPS
+        ],
+        "gender_distribution": [
+            {"gender": k.capitalize(), "count": popcount(bitmap & index.genders.get(k, 0))}
+            for k in ("male", "female")
+        ],
+        "condition_distribution": [
+            {"condition": k, "count": v}
+            for k, v in sorted(condition_counts.items(), key=lambda x: (-x[1], x[0]))
+        ],
+        "total_patients": popcount(bitmap),
+    }
+
+
+# --- Async variants ---
+# Same contracts as the sync endpoints, but parsing/filtering runs in the shared
+# process pool (off the GIL) and spaCy runs once per batch of concurrent queries.
+_nlp_batcher: Optional[MicroBatcher] = None
+
+
+def get_nlp_batcher() -> MicroBatcher:
+    global _nlp_batcher
+    if _nlp_batcher is None:
+        _nlp_batcher = MicroBatcher(
+            _extract_nlp_hints_batch,
+            max_batch=NLP_BATCH_SIZE,
+            max_wait=NLP_BATCH_WAIT_MS / 1000,
+        )
+    return _nlp_batcher
+
+
+@app.on_event("shutdown")
+def _shutdown_workers():
+    shutdown_process_pool()
+
+
+@app.exception_handler(WorkerError)
+async def _worker_error_handler(request, exc: WorkerError):
+    # Same response shape as an HTTPException raised in-process
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+
+@app.post("/async/query", response_model=QueryResponse)
+async def async_query_endpoint(body: QueryRequest):
+    """Async /query: spaCy micro-batched across requests, parse + filter in a worker process"""
+    started = time.perf_counter()
+    nlp_hints = await get_nlp_batcher().submit(body.query) if NLP_AVAILABLE else None
+    profile = None
+    if SLOW_QUERY_LOG.should_profile(body.profile):
+        response, profile = await run_in_process(
+            profile_call, run_query, body.query, body.approximate, nlp_hints, body.as_of
+        )
+    else:
+        response = await run_in_process(
+            run_query, body.query, body.approximate, nlp_hints, body.as_of
+        )
+    _log_query(body, response, started, profile)
+    return response
+
+
+@app.get("/async/analytics/chart-data", response_model=ChartDataResponse)
+async def async_chart_data(
+    age_filter: Optional[str] = None,
+    gender_filter: Optional[str] = None,
+    diagnosis_filter: Optional[str] = None,
+    approximate: bool = False,
+    as_of: Optional[datetime.date] = None,
+):
+    """Async /analytics/chart-data: aggregation runs in a worker process"""
+    return await run_in_process(
+        chart_data, age_filter, gender_filter, diagnosis_filter, approximate, as_of
+    )
+
+
+@app.get("/async/patients/search", response_model=SearchPatientsResponse)
+async def async_search_patients(
+    age_filter: Optional[str] = None,
+    gender_filter: Optional[str] = None,
+    diagnosis_filter: Optional[str] = None,
+    page: int = Query(default=1, ge=1),
+    limit: int = Query(default=10, ge=1, le=50),
+    as_of: Optional[datetime.date] = None,
+):
+    """Async /patients/search: filtering and formatting run in a worker process"""
+    return await run_in_process(
+        search_patients, age_filter, gender_filter, diagnosis_filter, page, limit, as_of
+    )
+
+
 if __name__ == "__main__":
     print("AI on FHIR Backend - Streamlined Version (updated)")
     print("=" * 60)
@@ -0,0 +1,223 @@
+"""
+CPU offload helpers for the async endpoints
+A shared process pool for parsing/filtering work and micro-batchers (one for
+the event loop, one for threadpool handlers) that group concurrent items
+(e.g. spaCy documents) into a single batch call.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _noop() -> None:
+    return None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating (and pre-forking) it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES)
+        # Start the workers now rather than on the first real request
+        _process_pool.submit(_noop).result()
+        logger.info(f"Started process pool with {WORKER_PROCESSES} workers")
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+
+
+def _reset_process_pool(broken: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next call starts a fresh one (unless already replaced)."""
+    global _process_pool
+    if _process_pool is broken:
+        _process_pool = None
+        logger.warning("Process pool broken; restarting it")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+class WorkerError(Exception):
+    """An exception raised inside a worker, re-raised in the parent as plain data."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _call_in_worker(fn: Callable, *args: Any) -> Tuple[bool, Any]:
+    """
+    Run fn(*args) and return (ok, result). Exceptions are returned as
+    (False, (status_code, detail)) rather than raised: some (e.g. FastAPI's
+    HTTPException) cannot be unpickled, and a failed unpickle breaks the pool.
+    """
+    try:
+        return True, fn(*args)
+    except Exception as exc:
+        if not hasattr(exc, "status_code"):
+            logger.exception(f"Error in worker running {getattr(fn, '__name__', fn)}")
+        return False, (
+            getattr(exc, "status_code", 500),
+            getattr(exc, "detail", str(exc)),
+        )
+
+
+async def run_in_process(fn: Callable, *args: Any) -> Any:
+    """
+    Run a picklable top-level function in the shared process pool.
+
+    Errors raised by fn surface as WorkerError. If a worker dies, the pool is
+    restarted and the call retried once.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_process_pool()
+        try:
+            ok, result = await loop.run_in_executor(pool, _call_in_worker, fn, *args)
+            break
+        except BrokenProcessPool:
+            _reset_process_pool(pool)
+            if attempt:
+                raise WorkerError(503, "Worker pool restarted; retry the request")
+    if not ok:
+        raise WorkerError(*result)
+    return result
+
+
+class MicroBatcher:
+    """
+    Collect items submitted concurrently on the event loop and hand them to
+    `process_batch` together.
+
+    A batch is flushed once `max_batch` items are pending or `max_wait`
+    seconds after its first item arrived, whichever comes first.
+    `process_batch` receives the list of items, must return one result per
+    item in the same order, and runs on the default thread executor so the
+    event loop stays responsive.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+    ):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(None, self.process_batch, items)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class _Slot:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ThreadBatcher:
+    """
+    MicroBatcher for synchronous callers (e.g. sync handlers on the threadpool).
+
+    The first caller of a batch waits up to `max_wait` seconds for others to
+    join, then runs `process_batch` for everyone in its own thread; a caller
+    that fills the batch to `max_batch` runs it straight away.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+    ):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[Any, _Slot]] = []
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Any:
+        slot = _Slot()
+        with self._lock:
+            batch = self._pending
+            batch.append((item, slot))
+            leader = len(batch) == 1
+            if len(batch) >= self.max_batch:
+                self._pending = []
+            else:
+                batch = None
+        if batch is not None:
+            self._run(batch)
+        elif leader and not slot.done.wait(self.max_wait):
+            # Unless a caller that filled our batch has already taken it
+            with self._lock:
+                if self._pending and self._pending[0][1] is slot:
+                    batch, self._pending = self._pending, []
+            if batch is not None:
+                self._run(batch)
+        slot.done.wait()
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _run(self, batch: List[Tuple[Any, _Slot]]) -> None:
+        try:
+            results = self.process_batch([item for item, _ in batch])
+        except Exception as exc:
+            for _, slot in batch:
+                slot.error = exc
+                slot.done.set()
+            return
+        for (_, slot), result in zip(batch, results):
+            slot.result = result
+            slot.done.set()
@@ -0,0 +1,101 @@
+"""
+Vectorized group-by counts for AI on FHIR Backend
+Each pivot dimension is encoded once per dataset as integer codes over patient
+rows (multi-valued dimensions as a CSR-style offsets + codes pair), so a pivot
+is a handful of numpy gathers plus one bincount over combined keys.
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from records import PatientRecord
+
+# Above this many possible key combinations, count with np.unique instead of
+# allocating a dense bincount array
+MAX_DENSE_KEYS = 1 << 24
+
+
+class CodedDimension:
+    """
+    One dimension as integer codes: patient row i has the values
+    values[codes[offsets[i]:offsets[i + 1]]] (codes sorted like values).
+    """
+
+    __slots__ = ("values", "offsets", "codes")
+
+    def __init__(self, per_patient: Iterable[Iterable[str]]):
+        distinct = set()
+        rows: List[Tuple[str, ...]] = []
+        for values in per_patient:
+            unique = tuple(set(values))
+            distinct.update(unique)
+            rows.append(unique)
+        self.values: List[str] = sorted(distinct)
+        position = {v: i for i, v in enumerate(self.values)}
+        lengths = np.fromiter((len(r) for r in rows), dtype=np.int64, count=len(rows))
+        self.offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.codes = np.fromiter(
+            (position[v] for r in rows for v in r), dtype=np.int32, count=int(self.offsets[-1])
+        )
+
+    @classmethod
+    def single(cls, codes: np.ndarray, values: List[str]) -> "CodedDimension":
+        """A dimension with exactly one value per row."""
+        dim = cls.__new__(cls)
+        dim.values = values
+        dim.offsets = np.arange(len(codes) + 1, dtype=np.int64)
+        dim.codes = codes
+        return dim
+
+
+class PivotCodes:
+    """Integer-coded gender, condition (code) and medication for a patient list."""
+
+    def __init__(self, patients: List[PatientRecord]):
+        self.size = len(patients)
+        self.dimensions: Dict[str, CodedDimension] = {
+            "gender": CodedDimension((p.gender,) for p in patients),
+            "condition": CodedDimension((c.code for c in p.conditions) for p in patients),
+            "medication": CodedDimension(p.medications for p in patients),
+        }
+
+
+def pivot_counts(
+    rows: np.ndarray,
+    dimensions: Sequence[CodedDimension],
+) -> Dict[Tuple[str, ...], int]:
+    """
+    Count patients `rows` by every combination of `dimensions` values.
+
+    A patient with several values in a multi-valued dimension counts once
+    under each. Keys are value tuples in dimension order; combinations with
+    no patients are omitted, and the result iterates in code order.
+    """
+    owner = np.arange(len(rows), dtype=np.int64)
+    key = np.zeros(len(rows), dtype=np.int64)
+    for dim in dimensions:
+        # Expand each (patient, key-so-far) entry once per value of this dimension
+        patient = rows[owner]
+        starts = dim.offsets[patient]
+        repeats = dim.offsets[patient + 1] - starts
+        total = int(repeats.sum())
+        first = np.cumsum(repeats) - repeats
+        within = np.arange(total, dtype=np.int64) - np.repeat(first, repeats)
+        codes = dim.codes[np.repeat(starts, repeats) + within]
+        owner = np.repeat(owner, repeats)
+        key = np.repeat(key, repeats) * len(dim.values) + codes
+
+    shape = tuple(len(dim.values) for dim in dimensions)
+    if int(np.prod(shape, dtype=np.float64)) <= MAX_DENSE_KEYS:
+        dense = np.bincount(key, minlength=int(np.prod(shape)))
+        present = np.flatnonzero(dense)
+        counts = dense[present]
+    else:
+        present, counts = np.unique(key, return_counts=True)
+    indices = np.unravel_index(present, shape)
+    return {
+        tuple(dim.values[i] for dim, i in zip(dimensions, combo)): int(count)
+        for combo, count in zip(zip(*(idx.tolist() for idx in indices)), counts.tolist())
+    }
@@ -0,0 +1,191 @@
+"""
+Slow-query log for AI on FHIR Backend
+Queries are grouped by a fingerprint of their parsed filter shape (age
+operator, gender present, diagnosis codes) and execution mode (approximate,
+as_of set); literal ages, dates and wording are ignored. Per-fingerprint latency and row-count statistics live in a bounded
+in-memory table, and slow or explicitly requested executions can carry a
+cProfile report.
+"""
+
+import cProfile
+import datetime
+import hashlib
+import io
+import json
+import logging
+import pstats
+import random
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def query_shape(filters: Any, approximate: bool = False, as_of: bool = False) -> Dict[str, Any]:
+    """
+    Normalized shape of a ParsedFilters: what is filtered on, not the literal
+    values, plus whether the query ran approximately and against an as_of date.
+    """
+    return {
+        "age": filters.age.op if filters.age else None,
+        "gender": filters.gender is not None,
+        "diagnoses": sorted(filters.diagnoses),
+        "approximate": approximate,
+        "as_of": as_of,
+    }
+
+
+def fingerprint(shape: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(shape, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def profile_call(fn: Callable, *args: Any, limit: int = 25) -> Tuple[Any, str]:
+    """Run fn(*args) under cProfile; return (result, top functions by cumulative time)."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(fn, *args)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return result, out.getvalue()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class QueryStats:
+    __slots__ = (
+        "fingerprint",
+        "shape",
+        "count",
+        "slow_count",
+        "total_ms",
+        "max_ms",
+        "recent_ms",
+        "total_rows",
+        "max_rows",
+        "last_query",
+        "last_seen",
+        "last_profile",
+    )
+
+    def __init__(self, fp: str, shape: Dict[str, Any], window: int):
+        self.fingerprint = fp
+        self.shape = shape
+        self.count = 0
+        self.slow_count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent_ms: deque = deque(maxlen=window)
+        self.total_rows = 0
+        self.max_rows = 0
+        self.last_query = ""
+        self.last_seen: Optional[datetime.datetime] = None
+        self.last_profile: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_ms)
+        return {
+            "fingerprint": self.fingerprint,
+            "shape": self.shape,
+            "count": self.count,
+            "slow_count": self.slow_count,
+            "mean_ms": round(self.total_ms / self.count, 3),
+            "p50_ms": round(percentile(recent, 50), 3),
+            "p95_ms": round(percentile(recent, 95), 3),
+            "p99_ms": round(percentile(recent, 99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "mean_rows": round(self.total_rows / self.count, 1),
+            "max_rows": self.max_rows,
+            "last_query": self.last_query,
+            "last_seen": self.last_seen,
+            "last_profile": self.last_profile,
+        }
+
+
+class SlowQueryLog:
+    """
+    Bounded per-fingerprint statistics table.
+
+    Keeps at most `max_fingerprints` entries (least recently seen evicted);
+    percentiles cover each fingerprint's last `window` executions. Executions
+    at or above `threshold_ms` are logged at WARNING.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 250.0,
+        max_fingerprints: int = 500,
+        window: int = 200,
+        profile_sample_rate: float = 0.0,
+    ):
+        self.threshold_ms = threshold_ms
+        self.max_fingerprints = max_fingerprints
+        self.window = window
+        self.profile_sample_rate = profile_sample_rate
+        self._entries: "OrderedDict[str, QueryStats]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def should_profile(self, requested: bool = False) -> bool:
+        return requested or (
+            self.profile_sample_rate > 0 and random.random() < self.profile_sample_rate
+        )
+
+    def record(
+        self,
+        filters: Any,
+        query: str,
+        elapsed_ms: float,
+        rows: int,
+        profile: Optional[str] = None,
+        approximate: bool = False,
+        as_of: bool = False,
+    ) -> str:
+        shape = query_shape(filters, approximate, as_of)
+        fp = fingerprint(shape)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            stats = self._entries.get(fp)
+            if stats is None:
+                stats = self._entries[fp] = QueryStats(fp, shape, self.window)
+                while len(self._entries) > self.max_fingerprints:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(fp)
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.recent_ms.append(elapsed_ms)
+            stats.total_rows += rows
+            stats.max_rows = max(stats.max_rows, rows)
+            stats.last_query = query
+            stats.last_seen = now
+            slow = elapsed_ms >= self.threshold_ms
+            if slow:
+                stats.slow_count += 1
+            if profile is not None:
+                stats.last_profile = {
+                    "query": query,
+                    "elapsed_ms": round(elapsed_ms, 3),
+                    "captured_at": now,
+                    "report": profile,
+                }
+        if slow:
+            logger.warning(
+                f"Slow query [{fp}] {elapsed_ms:.1f} ms, {rows} rows: {query!r}"
+            )
+        return fp
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Entries ordered by total time spent, most expensive first."""
+        with self._lock:
+            entries = [s.to_dict() for s in self._entries.values()]
+        return sorted(entries, key=lambda e: -e["mean_ms"] * e["count"])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,128 @@
+"""
+Stratified sampling for approximate analytics
+Keeps a fixed per-stratum sample of patients and turns sample counts into
+population estimates with normal-approximation confidence intervals.
+"""
+
+import math
+import random
+from typing import Any, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional
+
+# Two-sided 95% normal quantile
+Z_95 = 1.96
+
+
+class Estimate(NamedTuple):
+    count: float
+    low: float
+    high: float
+
+
+class StratifiedSample:
+    """
+    Per-stratum simple random sample of a patient list.
+
+    Every patient is assigned to exactly one stratum by `strata_key`; each
+    stratum keeps max(min_per_stratum, rate * size) members (or all of them
+    when the stratum is smaller than that), so rare strata stay represented.
+    """
+
+    def __init__(
+        self,
+        patients: List[Any],
+        strata_key: Callable[[Any], Hashable],
+        rate: float = 0.01,
+        min_per_stratum: int = 30,
+        seed: int = 0,
+    ):
+        rng = random.Random(seed)
+        members: Dict[Hashable, List[Any]] = {}
+        for p in patients:
+            members.setdefault(strata_key(p), []).append(p)
+
+        self.population_size = len(patients)
+        self.patients: List[Any] = []
+        self._strata: Dict[Hashable, tuple] = {}  # key -> (population N_h, sample n_h)
+        self._stratum_of: Dict[int, Hashable] = {}
+        for key, group in members.items():
+            n = min(len(group), max(min_per_stratum, math.ceil(rate * len(group))))
+            chosen = group if n == len(group) else rng.sample(group, n)
+            self._strata[key] = (len(group), n)
+            for p in chosen:
+                self._stratum_of[id(p)] = key
+            self.patients.extend(chosen)
+
+    def estimate_counts(
+        self,
+        matching: Iterable[Any],
+        labels: Optional[Callable[[Any], Iterable[Hashable]]] = None,
+        z: float = Z_95,
+        expected_labels: Iterable[Hashable] = (),
+        known: Optional[Callable[[Hashable, Hashable], Optional[bool]]] = None,
+    ) -> Dict[Hashable, Estimate]:
+        """
+        Estimate population counts from the sampled patients in `matching`.
+
+        `matching` must be a subset of `self.patients`. Each patient is counted
+        once under every label returned by `labels` (default: a single `None`
+        label, i.e. the total). Returns label -> Estimate for every label seen
+        plus every label in `expected_labels`, with the interval clipped to
+        [0, population_size].
+
+        `known(stratum, label)` may return True (every member of the stratum
+        matches with that label) or False (none does) when the stratum key
+        alone decides it, e.g. a gender filter against a gender stratum; such
+        strata contribute exactly N_h or 0. Otherwise strata with 0 < m < n
+        hits contribute a normal-approximation variance, and a sampled stratum
+        with no hits (or only hits) contributes the exact binomial one-sided
+        bound (the "rule of three": about 3.7 / n of the stratum at 95%),
+        scaled to a standard error and added in quadrature so the bounds of
+        many strata are not simply summed. An unseen label therefore reports 0
+        with a non-zero upper bound, not [0, 0], unless it is known impossible.
+        """
+        hits: Dict[Hashable, Dict[Hashable, int]] = {}
+        for p in matching:
+            stratum = self._stratum_of[id(p)]
+            for label in (labels(p) if labels else (None,)):
+                per_stratum = hits.setdefault(label, {})
+                per_stratum[stratum] = per_stratum.get(stratum, 0) + 1
+        for label in expected_labels:
+            hits.setdefault(label, {})
+
+        # One-sided tail probability matching the two-sided z interval
+        tail = math.erfc(z / math.sqrt(2)) / 2
+        estimates = {}
+        for label, per_stratum in hits.items():
+            total = 0.0
+            variance = 0.0
+            low_variance = high_variance = 0.0
+            for stratum, (big_n, n) in self._strata.items():
+                outcome = known(stratum, label) if known else None
+                if outcome is not None:
+                    total += big_n if outcome else 0
+                    continue
+                m = per_stratum.get(stratum, 0)
+                total += big_n * m / n
+                if n == big_n:
+                    continue  # stratum kept whole: exact
+                if 0 < m < n:
+                    p_hat = m / n
+                    variance += (
+                        big_n * big_n * (1 - n / big_n) * p_hat * (1 - p_hat) / (n - 1)
+                    )
+                else:
+                    # P(0 hits in n draws) <= tail  =>  p <= 1 - tail ** (1 / n)
+                    slack = big_n * (1 - tail ** (1 / n)) / z
+                    if m == 0:
+                        high_variance += slack * slack
+                    else:
+                        low_variance += slack * slack
+            estimates[label] = Estimate(
+                count=total,
+                low=max(0.0, total - z * math.sqrt(variance + low_variance)),
+                high=min(
+                    float(self.population_size),
+                    total + z * math.sqrt(variance + high_variance),
+                ),
+            )
+        return estimates
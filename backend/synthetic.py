@@ -0,0 +1,60 @@
+"""
+Synthetic cohort generator for AI on FHIR Backend
+Builds large patient lists with the same shape as SAMPLE_PATIENTS (no PHI)
+"""
+
+import datetime
+import random
+from typing import Dict, List
+
+from data import SAMPLE_PATIENTS
+
+
+def _vocabulary():
+    """Collect names, conditions and condition->medication pairings from the static data."""
+    given = sorted({p["name"]["given"][0] for p in SAMPLE_PATIENTS})
+    family = sorted({p["name"]["family"] for p in SAMPLE_PATIENTS})
+    conditions = {}
+    medications = {}
+    for p in SAMPLE_PATIENTS:
+        for i, c in enumerate(p["conditions"]):
+            conditions[c["code"]] = c["display"]
+            if i < len(p["medications"]):
+                medications.setdefault(c["code"], set()).add(p["medications"][i])
+    return (
+        given,
+        family,
+        sorted(conditions.items()),
+        {code: sorted(meds) for code, meds in medications.items()},
+    )
+
+
+def generate_patients(count: int, seed: int = 0) -> List[Dict]:
+    """Generate `count` synthetic patients shaped like SAMPLE_PATIENTS."""
+    rng = random.Random(seed)
+    given, family, conditions, medications = _vocabulary()
+    start = datetime.date(1930, 1, 1).toordinal()
+    end = datetime.date(2010, 12, 31).toordinal()
+
+    patients = []
+    for i in range(count):
+        chosen = rng.sample(conditions, rng.choice((1, 1, 2, 2, 3)))
+        meds = []
+        for code, _ in chosen:
+            if code in medications:
+                meds.append(rng.choice(medications[code]))
+        patients.append(
+            {
+                "id": f"synthetic-{i + 1:08d}",
+                "name": {"given": [rng.choice(given)], "family": rng.choice(family)},
+                "gender": rng.choice(("male", "female")),
+                "birthDate": datetime.date.fromordinal(
+                    rng.randint(start, end)
+                ).isoformat(),
+                "conditions": [
+                    {"code": code, "display": display} for code, display in chosen
+                ],
+                "medications": meds,
+            }
+        )
+    return patients
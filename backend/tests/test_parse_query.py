@@ -0,0 +1,17 @@
+"""parse_query keyword matching with and without spaCy lemma hints."""
+
+import pytest
+
+from main import parse_query
+
+
+@pytest.mark.parametrize("query", ["blood pressure high", "failure of heart"])
+def test_keywords_do_not_span_query_and_lemmas(query):
+    filters = parse_query(query, {"lemmas": query})
+    assert filters.diagnoses == parse_query(query).diagnoses == []
+
+
+def test_lemmas_add_keyword_matches():
+    filters = parse_query("females over 60", {"lemmas": "female over 60"})
+    assert filters.gender == "female"
+    assert filters.age.op == ">" and filters.age.age == 60